@@ -5,9 +5,12 @@ import os
 import json
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 from datetime import datetime
 import random
+import threading
 from lxml import etree
 from tqdm import tqdm
 from fake_useragent import UserAgent
@@ -15,7 +18,9 @@ from fake_useragent import UserAgent
 class WeiboSpider:
     def __init__(self):
         self.seen_weibos = set()
+        self._seen_lock = threading.Lock()  # 多线程搜索时保护 seen_weibos
         self.downloaded_images = set()  # 跟踪已下载的图片URL
+        self._downloaded_lock = threading.Lock()  # 多线程下载时保护 downloaded_images
         self.ua = UserAgent()
         self.base_url = "https://s.weibo.com/weibo"
         self.headers = {
@@ -28,6 +33,7 @@ class WeiboSpider:
         }
         
         # 从config.json读取配置
+        config = {}
         try:
             with open('config.json', 'r', encoding='utf-8') as f:
                 config = json.load(f)
@@ -42,10 +48,37 @@ class WeiboSpider:
             print(f"读取config.json失败: {str(e)}")
             self.cookies = {}
         
+        # 复用同一个会话，保持长连接并使用连接池（多线程下载时共享）
+        self.session = self._create_session(
+            max_retries=config.get('max_retries', 3),
+            retry_delay=config.get('retry_delay', 5)
+        )
+        
         # 创建下载目录
         self.media_dir = "media"
         os.makedirs(self.media_dir, exist_ok=True)
     
+    def _create_session(self, max_retries=3, retry_delay=5):
+        """
+        创建带连接池和自动重试的HTTP会话
+        
+        参数:
+        - max_retries: 最大重试次数
+        - retry_delay: 重试退避的基础间隔（秒），之后每次重试按指数递增
+        """
+        session = requests.Session()
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=retry_delay,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False  # 重试用尽后返回最后的响应，由调用处的状态码检查处理
+        )
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
     def _get_random_delay(self):
         """生成随机延迟，避免被检测为爬虫"""
         return random.uniform(1, 3)
@@ -68,10 +101,12 @@ class WeiboSpider:
         - 本地文件路径
         """
         try:
-            # 检查是否已经下载过这个URL
-            if url in self.downloaded_images:
-                print(f"图片已下载过，跳过: {url}")
-                return ""
+            # 检查是否已经下载过这个URL，并在锁内先占用，避免多线程重复下载
+            with self._downloaded_lock:
+                if url in self.downloaded_images:
+                    print(f"图片已下载过，跳过: {url}")
+                    return ""
+                self.downloaded_images.add(url)
             
             # print(f"DEBUG - 开始下载: {url}")
             
@@ -100,7 +135,7 @@ class WeiboSpider:
             headers = self.headers.copy()
             headers['Referer'] = 'https://weibo.com/'
             
-            response = requests.get(url, headers=headers, timeout=30, stream=True)
+            response = self.session.get(url, headers=headers, timeout=30, stream=True)
             response.raise_for_status()
             
             # 检查内容类型
@@ -117,13 +152,13 @@ class WeiboSpider:
             file_size = os.path.getsize(file_path)
             print(f"下载成功: {filename} (大小: {file_size} bytes)")
             
-            # 记录已下载的URL
-            self.downloaded_images.add(url)
-            
             return file_path
             
         except Exception as e:
             print(f"下载失败 {url}: {e}")
+            # 下载失败时释放占用，允许之后重试
+            with self._downloaded_lock:
+                self.downloaded_images.discard(url)
             return ""
     
     def extract_images(self, card, keyword, weibo_id):
@@ -212,7 +247,7 @@ class WeiboSpider:
                 return match.group(1)
         return None
 
-    def search_keyword(self, user_url, keyword, pages=5, start_page=1, download_media=False):
+    def search_keyword(self, user_url, keyword, pages=5, start_page=1, download_media=False, higher_priority_keywords=()):
         """
         在用户主页中搜索包含关键词的微博
         
@@ -222,12 +257,16 @@ class WeiboSpider:
         - pages: 爬取页数
         - start_page: 开始爬取的页码，默认从第1页开始
         - download_media: 是否下载媒体文件
+        - higher_priority_keywords: 排在当前关键词之前的关键词。并发搜索多个关键词时，
+          同时包含这些关键词的微博交给对应的搜索处理，保证微博总是归入列表中靠前的关键词，
+          且详情请求和媒体下载只发生一次
         
         返回:
         - 搜索结果列表
         """
         results = []
         self.download_media_enabled = download_media
+        higher_priority_keywords = [kw.lower() for kw in higher_priority_keywords]
         
         user_id = self._extract_user_id(user_url)
         if not user_id:
@@ -246,7 +285,7 @@ class WeiboSpider:
                 self._update_headers()
                 
                 # 发送请求
-                response = requests.get(
+                response = self.session.get(
                     search_url, 
                     headers=self.headers, 
                     cookies=self.cookies, 
@@ -275,19 +314,23 @@ class WeiboSpider:
                         # 检查是否包含关键词（不区分大小写）
                         if keyword.lower() not in content.lower():
                             continue
+                        
+                        # 同时匹配更靠前的关键词时，由那个关键词的搜索负责这条微博
+                        if any(kw in content.lower() for kw in higher_priority_keywords):
+                            continue
                             
                         weibo_id = str(weibo.get('id', '未知ID'))
                         
                         # 检查是否已经爬取过这条微博
-                        if weibo_id in self.seen_weibos:
-                            continue
-                        
-                        self.seen_weibos.add(weibo_id)
+                        with self._seen_lock:
+                            if weibo_id in self.seen_weibos:
+                                continue
+                            self.seen_weibos.add(weibo_id)
                         
                         # 获取微博详细信息
                         try:
                             detail_url = f"https://weibo.com/ajax/statuses/show?id={weibo_id}"
-                            response = requests.get(detail_url, headers=self.headers, cookies=self.cookies, timeout=10)
+                            response = self.session.get(detail_url, headers=self.headers, cookies=self.cookies, timeout=10)
                             if response.status_code == 200:
                                 detail_data = response.json()
                                 if detail_data:
@@ -388,7 +431,7 @@ class WeiboSpider:
                                 try:
                                     # 获取短链接的详细信息
                                     detail_url = f"https://weibo.com/ajax/statuses/show?id={weibo_id}"
-                                    response = requests.get(detail_url, headers=self.headers, cookies=self.cookies, timeout=10)
+                                    response = self.session.get(detail_url, headers=self.headers, cookies=self.cookies, timeout=10)
                                     if response.status_code == 200:
                                         detail_data = response.json()
                                         if detail_data:
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
+import csv
+import orjson
 import logging
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 from fetch import WeiboSpider
@@ -16,6 +18,47 @@ from PIL import Image
 import io
 import re
 import unicodedata
+import threading
+import heapq
+from functools import lru_cache
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None  # 未安装OpenCV时回退到PIL
+
+# 可能包含透明通道或调色板的格式，交给PIL处理
+_PIL_ONLY_EXTENSIONS = ('.png', '.gif')
+
+# JSON输出选项：缩进2格，允许非字符串键，直接序列化numpy数据
+_ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# 写入CSV时每批处理的行数
+_CSV_CHUNKSIZE = 10000
+
+# 汇总CSV保留的字段及其中的数值字段
+_ALL_RESULTS_COLUMNS = ['keyword', 'weibo_id', 'content', 'publish_time', 'reposts_count',
+                        'comments_count', 'attitudes_count', 'post_link']
+_COUNT_COLUMNS = ('reposts_count', 'comments_count', 'attitudes_count')
+
+# 取值重复度高、适合转为分类类型的列
+_CATEGORICAL_COLUMNS = ('keyword', 'type')
+
+# 内嵌预览图的默认最大尺寸和JPEG质量，可通过 config["image_max_size"]、config["image_quality"] 修改
+_DEFAULT_IMAGE_MAX_SIZE = (200, 200)
+_DEFAULT_IMAGE_QUALITY = 70
+
+# 尺寸已符合要求的JPEG不超过该字节数时才直接内嵌原文件，否则仍重新编码
+# （高质量或带大块EXIF/ICC数据的小图重新编码后更小）
+_JPEG_PASSTHROUGH_MAX_BYTES = 16 * 1024
+
+# 清理微博正文用的预编译正则
+_HTML_TAG_RE = re.compile(r'<[^>]*>')
+_EMOTION_RE = re.compile(r'\[.*?\]')
+_URL_RE = re.compile(r'http[s]?://\S+')
+_WS_RE = re.compile(r'\s+')
+_INVISIBLE_CHARS_RE = re.compile(r'[\u200b-\u200f\u2028-\u202f\u205f-\u206f]')
+_TRAILING_ZWSP_RE = re.compile(r'\u200b+$')
 
 # 配置日志
 logging.basicConfig(
@@ -39,13 +82,16 @@ def load_config():
         "max_retries": 3,
         "retry_delay": 5,
         "thread_pool_size": 4,
+        "image_max_size": list(_DEFAULT_IMAGE_MAX_SIZE),  # 内嵌Base64图片的最大尺寸
+        "image_quality": _DEFAULT_IMAGE_QUALITY,  # 内嵌Base64图片的JPEG质量
+        "top_n": None,  # 结果CSV只保留点赞量最高的N条，None表示全部保留
         "proxy": None
     }
     
     try:
         if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            with open(config_file, 'rb') as f:
+                config = orjson.loads(f.read())
                 # 确保所有必要的配置项都存在
                 for key, value in default_config.items():
                     if key not in config:
@@ -53,8 +99,8 @@ def load_config():
         else:
             config = default_config
             # 保存默认配置
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=4)
+            with open(config_file, 'wb') as f:
+                f.write(orjson.dumps(config, option=_ORJSON_OPTIONS))
         
         return config
     except Exception as e:
@@ -64,71 +110,224 @@ def load_config():
 def save_config(config):
     """保存配置到文件"""
     try:
-        with open("config.json", 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        with open("config.json", 'wb') as f:
+            f.write(orjson.dumps(config, option=_ORJSON_OPTIONS))
     except Exception as e:
         logging.error(f"保存配置文件时出错: {e}")
 
-def image_to_base64(image_path, max_size=(300, 300)):
+def _jpeg_dimensions(data):
+    """
+    从JPEG数据中解析图片尺寸
+    
+    参数:
+    - data: JPEG文件字节
+    
+    返回:
+    - (宽, 高)，不是JPEG或未找到SOF段时返回None
+    """
+    if data[:2] != b'\xff\xd8':
+        return None
+    
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # 填充字节
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # 无长度字段的标记
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # 图像结束或扫描数据开始，之后不再有SOF
+            return None
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+def _is_small_jpeg(raw, max_size):
+    """判断图片是否已是不超过max_size且文件足够小、可直接内嵌的JPEG"""
+    if len(raw) > _JPEG_PASSTHROUGH_MAX_BYTES:
+        return False
+    dimensions = _jpeg_dimensions(raw)
+    return dimensions is not None and dimensions[0] <= max_size[0] and dimensions[1] <= max_size[1]
+
+def _resize_keep_ratio(img, max_size):
+    """按最大尺寸等比缩小OpenCV图像（不放大）"""
+    height, width = img.shape[:2]
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    if scale < 1.0:
+        new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+    return img
+
+def _encode_with_opencv(raw, max_size, quality):
+    """使用OpenCV解码、缩放并编码为JPEG，返回编码后的字节缓冲区，失败时返回None"""
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    
+    img = _resize_keep_ratio(img, max_size)
+    # 体积缩小来自较低的quality和libjpeg默认的4:2:0色度抽样；
+    # 不设置单独的亮度/色度质量，两者不同时OpenCV会关闭色度抽样，反而使文件变大
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    ok, buf = cv2.imencode('.jpg', img, params)
+    if not ok:
+        return None
+    # imencode返回的数组可直接用于base64编码，无需复制为bytes
+    return buf
+
+def _encode_with_pil(raw, max_size, quality):
+    """使用PIL解码、缩放并编码为JPEG，返回编码后的字节缓冲区"""
+    with Image.open(io.BytesIO(raw)) as img:
+        # 转换为RGB（如果是RGBA等格式）
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        
+        # 计算缩放比例，保持长宽比
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        
+        # 将图片保存到内存中（小尺寸缩略图无需optimize的第二遍Huffman优化）
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, progressive=True, subsampling='4:2:0')
+        return buffer.getbuffer()
+
+def image_to_base64(image_path, max_size=_DEFAULT_IMAGE_MAX_SIZE, quality=_DEFAULT_IMAGE_QUALITY):
     """
     将图片转换为Base64编码字符串
     
+    优先使用OpenCV进行解码和JPEG编码，PNG/GIF（可能含透明通道或调色板）
+    以及OpenCV无法解码的文件回退到PIL处理。结果按(路径, 修改时间, 大小)缓存，
+    文件未变化时重复调用直接返回缓存结果
+    
     参数:
     - image_path: 图片文件路径
     - max_size: 最大尺寸(宽, 高)，用于压缩图片
+    - quality: JPEG编码质量
     
     返回:
     - Base64编码字符串
     """
     try:
-        if not os.path.exists(image_path):
-            return ""
+        stat = os.stat(image_path)
+    except OSError:
+        return ""
+    
+    cache_key = (image_path, stat.st_mtime, stat.st_size)
+    return _cached_image_to_base64(cache_key, tuple(max_size), quality)
+
+@lru_cache(maxsize=4096)
+def _cached_image_to_base64(cache_key, max_size, quality):
+    """按文件标识缓存的图片Base64编码实现"""
+    image_path = cache_key[0]
+    try:
+        # 只读取一次文件，之后的判断、解码均复用同一份字节
+        with open(image_path, 'rb') as f:
+            raw = f.read()
         
-        # 打开图片并调整大小以减少文件大小
-        with Image.open(image_path) as img:
-            # 转换为RGB（如果是RGBA等格式）
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # 计算缩放比例，保持长宽比
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # 将图片保存到内存中
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=85, optimize=True)
-            buffer.seek(0)
-            
-            # 转换为Base64
-            image_data = buffer.getvalue()
-            base64_string = base64.b64encode(image_data).decode('utf-8')
-            
-            return f"data:image/jpeg;base64,{base64_string}"
+        # 已经足够小的JPEG无需重新解码和编码
+        image_data = raw if _is_small_jpeg(raw, max_size) else None
+        if image_data is None:
+            ext = os.path.splitext(image_path)[1].lower()
+            if cv2 is not None and ext not in _PIL_ONLY_EXTENSIONS:
+                image_data = _encode_with_opencv(raw, max_size, quality)
+            if image_data is None:
+                image_data = _encode_with_pil(raw, max_size, quality)
+        
+        # 转换为Base64
+        base64_string = base64.b64encode(image_data).decode('utf-8')
+        
+        return f"data:image/jpeg;base64,{base64_string}"
     
     except Exception as e:
         logging.warning(f"转换图片到Base64时出错 {image_path}: {e}")
         return ""
 
-def add_image_data_to_weibos(weibos):
+def _scan_file_stats(paths):
+    """
+    批量获取文件的修改时间和大小
+    
+    Windows下 scandir 在列目录时已带回文件属性，按目录扫描一次即可省去逐个 stat；
+    POSIX下 DirEntry.stat() 仍需一次系统调用，直接对每个路径 stat，避免额外遍历目录中的其他文件
+    
+    参数:
+    - paths: 文件路径列表
+    
+    返回:
+    - 路径到 (修改时间, 大小) 的字典，不存在的文件不包含在内
+    """
+    file_stats = {}
+    if os.name != 'nt':
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            file_stats[path] = (stat.st_mtime, stat.st_size)
+        return file_stats
+    
+    paths_by_dir = {}
+    for path in paths:
+        directory, name = os.path.split(path)
+        paths_by_dir.setdefault(directory or '.', {})[name] = path
+    
+    for directory, names in paths_by_dir.items():
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    path = names.get(entry.name)
+                    if path is not None and entry.is_file():
+                        stat = entry.stat()
+                        file_stats[path] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            continue
+    return file_stats
+
+def add_image_data_to_weibos(weibos, config=None):
     """
     为微博数据添加图片的Base64编码
     
     参数:
     - weibos: 微博数据列表
+    - config: 配置字典（可选），使用其中的 thread_pool_size（编码线程数）、
+      image_max_size（图片最大尺寸）和 image_quality（JPEG质量），缺省时使用默认值
     
     返回:
     - 包含图片数据的微博列表
     """
+    config = config or {}
+    max_workers = config.get("thread_pool_size", 4)
+    max_size = tuple(config.get("image_max_size", _DEFAULT_IMAGE_MAX_SIZE))
+    quality = config.get("image_quality", _DEFAULT_IMAGE_QUALITY)
+    
+    # 收集所有微博中的图片路径并去重（如转发共享的图片），每个路径只编码一次
+    weibo_paths = []
+    unique_paths = {}
     for weibo in weibos:
         image_paths = weibo.get('image_paths', '')
-        base64_images = []
-        
-        if image_paths:
-            paths = image_paths.split('|')
-            for path in paths:
-                if path and os.path.exists(path):
-                    base64_data = image_to_base64(path)
-                    if base64_data:
-                        base64_images.append(base64_data)
+        paths = [path for path in image_paths.split('|') if path] if image_paths else []
+        weibo_paths.append(paths)
+        for path in paths:
+            unique_paths.setdefault(path, None)
+    
+    # 按目录批量获取文件信息，不存在的图片直接跳过
+    file_stats = _scan_file_stats(unique_paths)
+    
+    def encode(path):
+        cache_key = (path,) + file_stats[path]
+        return _cached_image_to_base64(cache_key, max_size, quality)
+    
+    # 图片解码/编码在C代码中释放GIL，使用线程池并行处理
+    encoded = {}
+    if file_stats:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            encoded = dict(zip(file_stats, executor.map(encode, file_stats)))
+    
+    for weibo, paths in zip(weibos, weibo_paths):
+        base64_images = [encoded[path] for path in paths if encoded.get(path)]
         
         # 添加Base64图片数据到微博信息中
         weibo['image_base64'] = '|'.join(base64_images) if base64_images else ''
@@ -136,7 +335,23 @@ def add_image_data_to_weibos(weibos):
     
     return weibos
 
-def download_filtered_media(spider, filtered_weibos, keyword):
+class _RateLimiter:
+    """线程安全的简单限速器，保证全局请求间隔不小于 min_interval 秒"""
+    
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+    
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def download_filtered_media(spider, filtered_weibos, keyword, max_workers=8, requests_per_second=2):
     """
     为通过筛选的高质量微博下载图片
     
@@ -144,62 +359,131 @@ def download_filtered_media(spider, filtered_weibos, keyword):
     - spider: 爬虫实例
     - filtered_weibos: 筛选后的微博列表
     - keyword: 关键词
+    - max_workers: 并行下载的线程数
+    - requests_per_second: 全局每秒最多发起的下载请求数，避免请求过快
     """
+    limiter = _RateLimiter(1.0 / requests_per_second)
+    
+    def download(url, weibo_id):
+        limiter.wait()
+        return spider.download_media(url, 'image', keyword, weibo_id)
+    
     downloaded_count = 0
-    for weibo in filtered_weibos:
-        if weibo.get('has_images', False):
-            image_urls = weibo.get('image_urls', '').split('|')
-            image_paths = []
-            
-            for url in image_urls:
-                if url:
-                    local_path = spider.download_media(url, 'image', keyword, weibo['weibo_id'])
-                    if local_path:
-                        image_paths.append(local_path)
-                        downloaded_count += 1
-                    time.sleep(0.5)  # 避免请求过快
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        weibo_futures = []
+        for weibo in filtered_weibos:
+            if weibo.get('has_images', False):
+                image_urls = weibo.get('image_urls', '').split('|')
+                futures = [executor.submit(download, url, weibo['weibo_id']) for url in image_urls if url]
+                weibo_futures.append((weibo, futures))
+        
+        for weibo, futures in weibo_futures:
+            image_paths = [future.result() for future in futures]
+            image_paths = [path for path in image_paths if path]
+            downloaded_count += len(image_paths)
             
             # 更新微博数据中的本地路径信息
             weibo['image_paths'] = '|'.join(image_paths)
     
     return downloaded_count
 
+# 微博时间格式：'5分钟前'、'3小时前'、'今天 12:34'、'昨天 12:34'、'05-23 12:34'、'2024-05-23 12:34'
+_TIME_RE = re.compile(
+    r'^(?:(?P<rel>\d+)\s*(?P<unit>分钟|小时)前'
+    r'|(?P<day>今天|昨天)\s*(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+    r'|(?:(?P<year>\d{4})-)?(?P<month>\d{1,2})-(?P<mday>\d{1,2})\s+(?P<hour2>\d{1,2}):(?P<minute2>\d{2}))$'
+)
+
+# 相对时间单位 -> timedelta 参数名
+_RELATIVE_TIME_UNITS = {
+    '分钟': 'minutes',
+    '小时': 'hours',
+}
+
+# 日期前缀 -> 距今天数
+_DAY_OFFSETS = {
+    '今天': 0,
+    '昨天': 1,
+}
+
+@lru_cache(maxsize=4096)
+def _parse_weibo_time(time_str, now_minute):
+    """parse_weibo_time 的缓存实现，now_minute 已精确到分钟以提高缓存命中率"""
+    match = _TIME_RE.match(time_str)
+    if not match:
+        return None
+    try:
+        if match.group('rel'):
+            unit = _RELATIVE_TIME_UNITS[match.group('unit')]
+            return now_minute - timedelta(**{unit: int(match.group('rel'))})
+        if match.group('day'):
+            dt = now_minute.replace(hour=int(match.group('hour')), minute=int(match.group('minute')))
+            return dt - timedelta(days=_DAY_OFFSETS[match.group('day')])
+        year = int(match.group('year')) if match.group('year') else now_minute.year
+        return datetime(year, int(match.group('month')), int(match.group('mday')),
+                        int(match.group('hour2')), int(match.group('minute2')))
+    except (ValueError, OverflowError):
+        return None
+
 def parse_weibo_time(time_str, now=None):
     """
     解析微博时间字符串为 datetime 对象。
     支持格式：'5分钟前'、'今天 12:34'、'昨天 12:34'、'2024-05-23 12:34'等。
+    相对时间以精确到分钟的 now 为基准计算，相同输入的解析结果会被缓存。
     """
     if now is None:
         now = datetime.now()
     time_str = str(time_str).strip()
     if not time_str or time_str == '未知时间':
         return None
+    return _parse_weibo_time(time_str, now.replace(second=0, microsecond=0))
+
+def parse_weibo_times(time_series, now=None):
+    """
+    批量解析一列微博时间字符串，解析规则与 parse_weibo_time 完全一致。
+    每个不同的字符串只解析一次，结果再映射回整列。
+    
+    参数:
+    - time_series: 时间字符串 Series
+    - now: 计算相对时间的基准时间，默认为当前时间
+    
+    返回:
+    - datetime64 Series，无法解析的为 NaT
+    """
+    if now is None:
+        now = datetime.now()
+    unique_times = time_series.unique()
+    parsed = {time_str: parse_weibo_time(time_str, now=now) for time_str in unique_times}
+    return pd.to_datetime(time_series.map(parsed), errors='coerce')
+
+def _safe_int(value):
+    """将计数字段转换为整数，空值或无法解析时返回0"""
     try:
-        if '分钟前' in time_str:
-            minutes = int(time_str.replace('分钟前', '').strip())
-            return now - timedelta(minutes=minutes)
-        elif '小时前' in time_str:
-            hours = int(time_str.replace('小时前', '').strip())
-            return now - timedelta(hours=hours)
-        elif '今天' in time_str:
-            t = time_str.replace('今天', '').strip()
-            dt = datetime.strptime(t, '%H:%M')
-            return now.replace(hour=dt.hour, minute=dt.minute, second=0, microsecond=0)
-        elif '昨天' in time_str:
-            t = time_str.replace('昨天', '').strip()
-            dt = datetime.strptime(t, '%H:%M')
-            dt = now.replace(hour=dt.hour, minute=dt.minute, second=0, microsecond=0) - timedelta(days=1)
-            return dt
-        elif '-' in time_str:
-            # 可能是 '05-23 12:34' 或 '2024-05-23 12:34'
-            if len(time_str) == 11:  # '05-23 12:34'
-                t = f"{now.year}-{time_str}"
-                return datetime.strptime(t, '%Y-%m-%d %H:%M')
-            elif len(time_str) == 16:  # '2024-05-23 12:34'
-                return datetime.strptime(time_str, '%Y-%m-%d %H:%M')
-    except Exception:
-        pass
-    return None
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+def dedupe_weibos(weibos, seen=None):
+    """
+    按weibo_id去除重复微博，保留首次出现的记录
+    
+    参数:
+    - weibos: 微博数据列表
+    - seen: 已处理过的微博ID集合，会被原地更新；为None时只在本列表内去重
+    
+    返回:
+    - 去重后的微博列表
+    """
+    if seen is None:
+        seen = set()
+    unique_weibos = []
+    for weibo in weibos:
+        weibo_id = weibo.get('weibo_id')
+        if weibo_id in seen:
+            continue
+        seen.add(weibo_id)
+        unique_weibos.append(weibo)
+    return unique_weibos
 
 def process_keyword(keyword, spider, ml_analyzer, config, now, keyword_to_type):
     """处理单个关键词的爬取和分析"""
@@ -222,16 +506,16 @@ def process_keyword(keyword, spider, ml_analyzer, config, now, keyword_to_type):
             logging.warning(f"未找到关键词 '{keyword}' 的相关微博")
             return None
         
+        # 去除重复微博，避免重复进行机器学习分析和图片处理
+        results = dedupe_weibos(results)
         logging.info(f"获取到 {len(results)} 条微博")
         
         # ====== 筛选最近两天的微博（不再强制要求视频） ======
         now_dt = datetime.now()
         two_days_ago = now_dt - timedelta(days=2)
-        filtered_by_time = []
-        for weibo in results:
-            dt = parse_weibo_time(weibo.get('publish_time', ''), now=now_dt)
-            if dt and dt >= two_days_ago:
-                filtered_by_time.append(weibo)
+        publish_times = parse_weibo_times(pd.Series([weibo.get('publish_time', '') for weibo in results]), now=now_dt)
+        recent_mask = (publish_times >= two_days_ago).to_numpy()
+        filtered_by_time = [weibo for weibo, is_recent in zip(results, recent_mask) if is_recent]
         logging.info(f"筛选后剩余 {len(filtered_by_time)} 条最近两天的微博")
         if not filtered_by_time:
             logging.warning(f"最近两天没有关键词 '{keyword}' 的相关微博")
@@ -272,18 +556,24 @@ def process_keyword(keyword, spider, ml_analyzer, config, now, keyword_to_type):
         os.makedirs(result_dir, exist_ok=True)
         
         # 保存过滤后的微博数据
-        df = pd.DataFrame(filtered_results)
-        df = clean_and_reorder_dataframe(df)  # 清理和重新排列列
-        # 按点赞量降序排序
-        df = df.sort_values(by='likes', ascending=False)
+        top_n = config.get("top_n")
+        likes_key = lambda x: _safe_int(x.get('attitudes_count'))
+        if top_n:
+            # 只保存点赞量(attitudes_count)最高的 top_n 条，堆选择无需对全部结果排序，结果已按点赞量降序排列
+            saved_results = heapq.nlargest(top_n, filtered_results, key=likes_key)
+        else:
+            # 按点赞量(attitudes_count)降序排序
+            saved_results = sorted(filtered_results, key=likes_key, reverse=True)
+        df = clean_and_reorder_dataframe(pd.DataFrame(saved_results))  # 清理和重新排列列
         keyword_file = f"{result_dir}/{keyword}_{now}.csv"
-        df.to_csv(keyword_file, index=False, encoding='utf-8-sig')
+        df.to_csv(keyword_file, index=False, encoding='utf-8-sig',
+                  chunksize=_CSV_CHUNKSIZE, lineterminator='\n')
         logging.info(f"已保存过滤后的结果到 {keyword_file}")
         
         # 保存分析结果
         analysis_file = f"{result_dir}/{keyword}_analysis_{now}.json"
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis_result, f, ensure_ascii=False, indent=2)
+        with open(analysis_file, 'wb') as f:
+            f.write(orjson.dumps(analysis_result, option=_ORJSON_OPTIONS))
         logging.info(f"已保存分析结果到 {analysis_file}")
         
         # 输出热门话题
@@ -311,11 +601,8 @@ def load_keyword_classifications():
     try:
         if os.path.exists(classification_file):
             df = pd.read_csv(classification_file, encoding='utf-8')
-            # 创建关键词到分类的映射
-            for _, row in df.iterrows():
-                keyword = row.iloc[0]  # 第一列是关键词
-                classification = row.iloc[1]  # 第二列是分类
-                keyword_to_type[keyword] = classification
+            # 创建关键词到分类的映射：第一列是关键词，第二列是分类
+            keyword_to_type = dict(zip(df.iloc[:, 0].to_numpy(), df.iloc[:, 1].to_numpy()))
             
             logging.info(f"成功加载 {len(keyword_to_type)} 个关键词分类")
         else:
@@ -332,50 +619,70 @@ def clean_and_reorder_dataframe(df):
     required_columns = ['weibo_id', 'content', 'publish_time', 'reposts_count', 'comments_count', 
                         'attitudes_count', 'post_link', 'video_url', 'video_cover']
     
-    # 添加空列，如果不存在
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = ''
+    # 重新排序列，优先显示重要信息；如果有其他额外的列，也保留；删除用户名字段
+    ordered_columns = ['keyword'] + required_columns
+    final_columns = [col for col in ordered_columns if col in df.columns or col in required_columns]
+    final_columns += [col for col in df.columns if col not in ordered_columns and col != 'user_name']
     
-    # 删除用户名字段
-    if 'user_name' in df.columns:
-        df = df.drop(columns=['user_name'])
+    # 一次reindex完成列的补齐（缺失列填空字符串）、删除和排序
+    df = df.reindex(columns=final_columns, fill_value='')
     
     # 确保post_link列非空，如果为空则使用weibo_id生成
     if 'weibo_id' in df.columns:
         mask = (df['post_link'].isna()) | (df['post_link'] == '')
-        df.loc[mask, 'post_link'] = df.loc[mask, 'weibo_id'].apply(
-            lambda x: f'https://weibo.com/detail/{x}'
-        )
+        df.loc[mask, 'post_link'] = 'https://weibo.com/detail/' + df.loc[mask, 'weibo_id'].astype(str)
     
     # 清理content，保留纯文本
     if 'content' in df.columns:
+        content = df['content'].astype(str)
         # 移除HTML标签
-        df['content'] = df['content'].astype(str).replace(r'<[^>]*>', '', regex=True)
+        content = content.str.replace(_HTML_TAG_RE, '', regex=True)
         # 移除微博特殊标记如[表情]
-        df['content'] = df['content'].replace(r'\[.*?\]', '', regex=True)
+        content = content.str.replace(_EMOTION_RE, '', regex=True)
         # 移除链接
-        df['content'] = df['content'].replace(r'http[s]?://\S+', '', regex=True)
+        content = content.str.replace(_URL_RE, '', regex=True)
         # 移除多余空格和换行
-        df['content'] = df['content'].replace(r'\s+', ' ', regex=True).str.strip()
+        content = content.str.replace(_WS_RE, ' ', regex=True).str.strip()
         # 移除特殊Unicode字符
-        df['content'] = df['content'].replace(r'[\u200b-\u200f\u2028-\u202f\u205f-\u206f]', '', regex=True)
+        content = content.str.replace(_INVISIBLE_CHARS_RE, '', regex=True)
         # 移除"​​​"结尾（这是微博文本常见的结尾）
-        df['content'] = df['content'].replace(r'​+$', '', regex=True)
-    
-    # 重新排序列，优先显示重要信息
-    ordered_columns = ['keyword'] + required_columns
+        df['content'] = content.str.replace(_TRAILING_ZWSP_RE, '', regex=True)
     
-    # 只保留在ordered_columns中的列
-    existing_columns = [col for col in ordered_columns if col in df.columns]
+    # 低基数的文本列转为分类类型，减少内存占用
+    for col in _CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
     
-    # 如果有其他额外的列，也保留
-    extra_columns = [col for col in df.columns if col not in ordered_columns]
+    return df
+
+def _clean_content(text):
+    """清理单条微博正文，与 clean_and_reorder_dataframe 中的处理一致"""
+    text = _HTML_TAG_RE.sub('', str(text))
+    text = _EMOTION_RE.sub('', text)
+    text = _URL_RE.sub('', text)
+    text = _WS_RE.sub(' ', text).strip()
+    text = _INVISIBLE_CHARS_RE.sub('', text)
+    return _TRAILING_ZWSP_RE.sub('', text)
+
+def clean_weibo_records(weibos):
+    """
+    逐条清理微博数据，用于流式写入汇总CSV
     
-    # 合并列顺序
-    final_columns = existing_columns + extra_columns
+    参数:
+    - weibos: 微博数据列表
     
-    return df[final_columns]
+    返回:
+    - 只包含汇总字段的微博字典列表
+    """
+    records = []
+    for weibo in weibos:
+        record = {col: weibo.get(col, '') for col in _ALL_RESULTS_COLUMNS}
+        # 确保post_link非空，如果为空则使用weibo_id生成
+        if not record['post_link']:
+            record['post_link'] = f"https://weibo.com/detail/{record['weibo_id']}"
+        record['content'] = _clean_content(record['content'])
+        records.append(record)
+    return records
 
 def read_keywords(file_path):
     """读取关键词列表文件"""
@@ -458,73 +765,103 @@ def main():
     # 当前时间，用于文件命名
     now = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    # 存储所有结果
-    all_results = []
+    # 汇总结果边爬取边写入CSV，不在内存中保留全部微博
+    output_file = os.path.join(result_dir, f"all_results_{now}.csv")
+    total_count = 0
+    processed_ids = set()  # 已写入的微博ID，跨用户和关键词去重
 
-    # 处理每个用户
-    for i, user_url in enumerate(user_urls, 1):
-        logging.info(f"\n处理第 {i}/{len(user_urls)} 个用户: {user_url}")
-        user_id = spider._extract_user_id(user_url) or f"user_{i}"
-        
-        # 对每个关键词进行搜索
-        for keyword in keywords:
-            logging.info(f"\n搜索关键词: {keyword}")
-            try:
-                # 爬取该用户的微博
-                results = spider.search_keyword(
-                    user_url=user_url,
-                    keyword=keyword,
-                    pages=1,  # 固定为1页
-                    download_media=config["download_media"]
-                )
-                
-                if results:
-                    # 为每条微博添加用户ID和关键词信息
-                    for result in results:
-                        result['user_id'] = user_id
-                        result['keyword'] = keyword
-                    all_results.extend(results)
-                    logging.info(f"找到 {len(results)} 条包含关键词 '{keyword}' 的微博")
-                else:
-                    logging.info(f"未找到包含关键词 '{keyword}' 的微博")
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=_ALL_RESULTS_COLUMNS, restval='',
+                                extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+
+        # 处理每个用户
+        for i, user_url in enumerate(user_urls, 1):
+            logging.info(f"\n处理第 {i}/{len(user_urls)} 个用户: {user_url}")
+            user_id = spider._extract_user_id(user_url) or f"user_{i}"
+            
+            # 并发搜索各关键词（网络请求为主，适合线程池）
+            with ThreadPoolExecutor(max_workers=config["thread_pool_size"]) as executor:
+                # 传入靠前的关键词，命中多个关键词的微博只由其中最靠前的关键词抓取，
+                # 归属与线程执行先后无关，详情请求和媒体下载也只发生一次
+                futures = [
+                    executor.submit(
+                        spider.search_keyword,
+                        user_url=user_url,
+                        keyword=keyword,
+                        pages=1,  # 固定为1页
+                        download_media=config["download_media"],
+                        higher_priority_keywords=keywords[:index]
+                    )
+                    for index, keyword in enumerate(keywords)
+                ]
                 
-            except Exception as e:
-                logging.error(f"处理关键词 {keyword} 时出错: {str(e)}")
-                continue
+                # 按提交顺序读取结果，命中多个关键词的微博始终归入列表中靠前的关键词
+                for keyword, future in zip(keywords, futures):
+                    try:
+                        results = dedupe_weibos(future.result() or [], processed_ids)
+                        
+                        if results:
+                            # 为每条微博添加用户ID和关键词信息
+                            for result in results:
+                                result['user_id'] = user_id
+                                result['keyword'] = keyword
+                            writer.writerows(clean_weibo_records(results))
+                            total_count += len(results)
+                            logging.info(f"找到 {len(results)} 条包含关键词 '{keyword}' 的微博")
+                        else:
+                            logging.info(f"未找到包含关键词 '{keyword}' 的微博")
+                        
+                    except Exception as e:
+                        logging.error(f"处理关键词 {keyword} 时出错: {str(e)}")
+                        continue
 
-    # 保存所有结果到CSV文件
-    if all_results:
+    # 对已写入的结果排序并保存
+    if total_count:
         try:
-            # 转换为DataFrame
-            df_all = pd.DataFrame(all_results)
-            
-            # 清理和重新排序DataFrame
-            df_all = clean_and_reorder_dataframe(df_all)
-            
-            # 添加分类信息
-            df_all['keyword_type'] = df_all['keyword'].map(keyword_to_type).fillna('other')
+            # 排序需要把全部行读回内存，峰值内存仍随结果条数线性增长(O(N))，
+            # 只是每行只含精简后的字段，比原始微博数据小得多
+            text_columns = [col for col in _ALL_RESULTS_COLUMNS if col not in _COUNT_COLUMNS]
+            df_all = pd.read_csv(output_file, encoding='utf-8-sig',
+                                 dtype={col: str for col in text_columns}, keep_default_na=False)
+            # 空的计数单元格会使整列变成字符串，这里统一转为可空整数，保证按数值排序
+            for col in _COUNT_COLUMNS:
+                df_all[col] = pd.to_numeric(df_all[col], errors='coerce').round().astype('Int64')
             
             # 先按关键词分类排序（show类别优先），然后按点赞量降序排序
-            df_all['is_show'] = (df_all['keyword_type'] == 'show').astype(int)
-            df_all = df_all.sort_values(by=['is_show', 'attitudes_count'], ascending=[False, False])
-            
-            # 删除辅助排序列
-            if 'is_show' in df_all.columns:
-                df_all = df_all.drop(columns=['is_show'])
-            if 'keyword_type' in df_all.columns:
-                df_all = df_all.drop(columns=['keyword_type'])
+            is_show = (df_all['keyword'].map(keyword_to_type).fillna('other') == 'show').astype(int)
+            df_all = df_all.assign(is_show=is_show)
+            top_n = config.get("top_n")
+            if top_n:
+                # 只保留排序最靠前的 top_n 条，部分选择代替全量排序
+                df_all = df_all.nlargest(top_n, ['is_show', 'attitudes_count'])
+            else:
+                df_all = df_all.sort_values(by=['is_show', 'attitudes_count'], ascending=[False, False])
+            df_all = df_all.drop(columns=['is_show'])
             
             # 不再过滤视频，保留所有微博
             
-            # 保存为CSV
-            output_file = os.path.join(result_dir, f"all_results_{now}.csv")
-            df_all.to_csv(output_file, index=False, encoding='utf-8-sig')
+            # 保存为CSV：先写入临时文件再替换，写入中途失败时不会破坏已爬取的原始数据
+            tmp_file = output_file + '.tmp'
+            try:
+                df_all.to_csv(tmp_file, index=False, encoding='utf-8-sig',
+                              chunksize=_CSV_CHUNKSIZE, lineterminator='\n')
+            except Exception:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+            os.replace(tmp_file, output_file)
             
-            # 删除多余字段，只保留指定字段
-            keep_columns = ['keyword', 'weibo_id', 'content', 'publish_time', 'reposts_count', 'comments_count', 'attitudes_count', 'post_link']
-            existing_keep_columns = [col for col in keep_columns if col in df_all.columns]
-            df_filtered = df_all[existing_keep_columns]
-            df_filtered.to_csv(output_file, index=False, encoding='utf-8-sig')
+            # 同时保存Parquet副本，供后续分析直接读取而无需重新解析CSV
+            parquet_file = os.path.splitext(output_file)[0] + '.parquet'
+            try:
+                df_all.to_parquet(parquet_file, index=False)
+                logging.info(f"已保存Parquet副本到: {parquet_file}")
+            except ImportError:
+                logging.warning("未安装pyarrow，跳过Parquet文件保存")
+            except Exception as e:
+                # Parquet只是副本，写入失败（如对象列类型混杂）不应影响已保存的CSV和画廊生成
+                logging.warning(f"保存Parquet文件失败，已跳过: {e}")
             
             logging.info(f"\n已保存所有微博到: {output_file}")
             logging.info(f"总共获取到 {len(df_all)} 条微博")
@@ -569,6 +906,7 @@ def main():
         except Exception as e:
             logging.error(f"保存结果到CSV时出错: {str(e)}")
     else:
+        os.remove(output_file)
         logging.warning("未获取到任何结果")
 
 if __name__ == '__main__':